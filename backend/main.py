@@ -1,7 +1,11 @@
 # backend/main.py
 import os
+import asyncio
 import glob
-import json
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
 from typing import List, Optional
 from fastapi import FastAPI, Query, HTTPException, Body
 from pydantic import BaseModel
@@ -9,27 +13,63 @@ from sentence_transformers import SentenceTransformer
 import numpy as np
 import faiss
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+import orjson
 from transformers import pipeline
 
+try:
+    import hyperscan  # optional: compiled multi-pattern matcher for polarity detection
+except ImportError:
+    hyperscan = None
+
 # ----- CONFIG -----
 EMBEDDINGS_DIR = os.path.join("data", "embeddings")
 TEXTS_DIR = os.path.join("data", "texts")
 MODEL_NAME = "all-MiniLM-L6-v2"
+# int8 ONNX export of MODEL_NAME, produced by scripts/export_onnx.py
+ENCODER_ONNX_DIR = os.path.join("data", "models", "all-MiniLM-L6-v2-onnx-int8")
+ENCODER_MAX_TOKENS = 256  # all-MiniLM-L6-v2's max_seq_length
 DEFAULT_K = 5
-FEEDBACK_PATH = os.path.join("data", "feedback.json")
+MAX_OCCURRENCES_PER_RESULT = 10  # /search lists this many of a passage's occurrences, plus the total count
+MAX_CARDS_PER_PASSAGE = 2  # /qa evidence cards from one (possibly boilerplate) passage shared by many papers
+BATCH_WINDOW_S = 0.01  # how long the search batcher waits for stragglers once queries are queued up
+MAX_BATCH_SIZE = 32
+SUMMARIZER_MODEL = "sshleifer/distilbart-cnn-12-6"
+# int8 ONNX export of SUMMARIZER_MODEL, produced by scripts/export_onnx.py
+SUMMARIZER_ONNX_DIR = os.path.join("data", "models", "distilbart-cnn-12-6-onnx-int8")
+# precompiled patterns for summary text cleanup
+_RE_ETAL = re.compile(r'\(.*?et al\.,? ?\d{4}.*?\)')
+_RE_URL = re.compile(r'https?://\S+')
+_RE_CITE = re.compile(r'\([^)]+\d{4}[^)]*\)')
+_RE_WS = re.compile(r'\s+')
+_RE_IMG_URL = re.compile(r'(https?://[^\s]+\.(?:png|jpg|jpeg|gif))')
+
+SUMMARIES_DIR = os.path.join("data", "summaries")
+FEEDBACK_PATH = os.path.join("data", "feedback.jsonl")
 def _append_feedback(obj):
+    # JSON Lines: one O(1) append per entry instead of re-reading and rewriting the whole file
     try:
-        if os.path.exists(FEEDBACK_PATH):
-            arr = json.load(open(FEEDBACK_PATH, encoding="utf-8"))
-        else:
-            arr = []
-        arr.append(obj)
-        json.dump(arr, open(FEEDBACK_PATH, "w", encoding="utf-8"), ensure_ascii=False, indent=2)
+        with open(FEEDBACK_PATH, "ab") as f:
+            f.write(orjson.dumps(obj) + b"\n")
         return True
     except Exception:
         return False
 
-app = FastAPI(title="SpaceBio Engine (Simple API)")
+def _load_feedback():
+    # stream entries back out of the JSONL file (skips blank / partially written lines)
+    if not os.path.exists(FEEDBACK_PATH):
+        return
+    with open(FEEDBACK_PATH, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield orjson.loads(line)
+            except ValueError:
+                continue
+
+app = FastAPI(title="SpaceBio Engine (Simple API)", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -42,7 +82,22 @@ app.add_middleware(
 )
 
 # Load summarization pipeline once at startup
-summarizer = pipeline("summarization", model="facebook/bart-large-cnn", device=-1)  # Force CPU to avoid MPS errors on Mac
+def load_summarizer():
+    # prefer the int8 ONNX Runtime export; fall back to the PyTorch checkpoint if it (or optimum) is missing
+    if os.path.isdir(SUMMARIZER_ONNX_DIR):
+        try:
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM
+            from transformers import AutoTokenizer
+            print("Loading summarizer (ONNX int8):", SUMMARIZER_ONNX_DIR)
+            ort_model = ORTModelForSeq2SeqLM.from_pretrained(SUMMARIZER_ONNX_DIR, provider="CPUExecutionProvider")
+            tokenizer = AutoTokenizer.from_pretrained(SUMMARIZER_ONNX_DIR)
+            return pipeline("summarization", model=ort_model, tokenizer=tokenizer)
+        except Exception as e:  # missing optimum, or an incomplete / broken export
+            print(f"ONNX summarizer failed to load ({e}), falling back to PyTorch")
+    print("Loading summarizer:", SUMMARIZER_MODEL)
+    return pipeline("summarization", model=SUMMARIZER_MODEL, device=-1)  # Force CPU to avoid MPS errors on Mac
+
+summarizer = load_summarizer()
 
 # ----- UTIL: find index and metadata paths -----
 def find_index_and_metadata():
@@ -52,6 +107,7 @@ def find_index_and_metadata():
         raise FileNotFoundError(f"No .index file found in {EMBEDDINGS_DIR}.")
     index_path = idx_files[0]
     meta_path_candidates = [
+        os.path.join(EMBEDDINGS_DIR, "metadata.npy"),  # fixed-width records (scripts/chunk_and_embed.py)
         os.path.join(EMBEDDINGS_DIR, "metadata.json"),
         os.path.join(EMBEDDINGS_DIR, "metadata.json".lower())
     ]
@@ -72,60 +128,377 @@ def find_index_and_metadata():
 
 INDEX_PATH, METADATA_PATH, SAMPLE_PASSAGES_PATH = find_index_and_metadata()
 
+class OnnxSentenceEncoder:
+    """
+    Drop-in for SentenceTransformer.encode over the int8 ONNX export of MODEL_NAME:
+    mean pooling + L2 normalization, like the model's own Pooling / Normalize modules.
+    """
+    def __init__(self, model_dir):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir, file_name="model_quantized.onnx", provider="CPUExecutionProvider")
+
+    def encode(self, sentences, batch_size=32):
+        # length-sorted batches keep padding small; results are returned in input order
+        order = sorted(range(len(sentences)), key=lambda i: -len(sentences[i]))
+        embs = np.zeros((len(sentences), self.model.config.hidden_size), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            idxs = order[start:start + batch_size]
+            batch = self.tokenizer([sentences[i] for i in idxs], padding=True, truncation=True,
+                                   max_length=ENCODER_MAX_TOKENS, return_tensors="np")
+            hidden = self.model(**batch).last_hidden_state
+            mask = batch["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            embs[idxs] = pooled
+        return embs
+
+def load_encoder():
+    # prefer the int8 ONNX Runtime export; fall back to the PyTorch model if it (or optimum) is missing
+    if os.path.isdir(ENCODER_ONNX_DIR):
+        try:
+            print("Loading embedding model (ONNX int8):", ENCODER_ONNX_DIR)
+            return OnnxSentenceEncoder(ENCODER_ONNX_DIR)
+        except Exception as e:  # missing optimum, or an incomplete / broken export
+            print(f"ONNX encoder failed to load ({e}), falling back to PyTorch")
+    print("Loading embedding model:", MODEL_NAME)
+    return SentenceTransformer(MODEL_NAME)
+
 # ----- LOAD MODEL + INDEX + METADATA -----
-print("Loading embedding model:", MODEL_NAME)
-model = SentenceTransformer(MODEL_NAME)
+model = load_encoder()
+
+faiss.omp_set_num_threads(os.cpu_count() or 1)
+
+# memory-map the index read-only so uvicorn workers share its pages instead of each holding a copy
+# (IO_FLAG_MMAP covers IVF lists; IO_FLAG_MMAP_IFC, on newer faiss, covers flat codes)
+INDEX_IO_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
 
 print("Loading FAISS index:", INDEX_PATH)
-index = faiss.read_index(INDEX_PATH)
+try:
+    index = faiss.read_index(INDEX_PATH, INDEX_IO_FLAGS)
+except RuntimeError as e:
+    print(f"mmap load failed ({e}), reading index into memory")
+    index = faiss.read_index(INDEX_PATH)
+# cosine indexes (built from normalized embeddings) need normalized queries too
+NORMALIZE_QUERIES = index.metric_type == faiss.METRIC_INNER_PRODUCT
+try:
+    # IVF indexes: probe ~sqrt(nlist) lists per query (flat indexes are exhaustive, nothing to tune)
+    ivf = faiss.extract_index_ivf(index)
+    ivf.nprobe = max(1, int(math.sqrt(ivf.nlist)))
+    print(f"IVF index: nlist={ivf.nlist}, nprobe={ivf.nprobe}")
+except RuntimeError:
+    pass
+
+class RecordMetadata:
+    """
+    List-like view over the memory-mapped metadata.npy records, one item per indexed passage;
+    items are returned as dicts (titles are looked up from the paper texts by paper_id).
+    With deduplicated builds, passage i occurred at records[offsets[i]:offsets[i+1]].
+    """
+    def __init__(self, records, offsets=None):
+        self.records = records
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1 if self.offsets is not None else len(self.records)
+
+    def __getitem__(self, idx):
+        return self.occurrences(idx)[0]
+
+    def occurrences(self, idx, limit=None):
+        # limit slices the records before any dicts are built
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        if self.offsets is None:
+            return [self._to_dict(self.records[idx])]
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        if limit is not None:
+            end = min(end, start + limit)
+        return [self._to_dict(r) for r in self.records[start:end]]
+
+    def num_occurrences(self, idx):
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return 1 if self.offsets is None else int(self.offsets[idx + 1] - self.offsets[idx])
+
+    @staticmethod
+    def _to_dict(r):
+        pid = str(r["paper_id"])
+        return {
+            "paper_id": pid,
+            "title": (TEXTS_CACHE.get(pid) or {}).get("title"),
+            "section": str(r["section"]),
+            "chunk_id": int(r["chunk_id"])
+        }
+
+    def section_counts(self):
+        counts = Counter()
+        for sec, n in zip(*np.unique(self.records["section"], return_counts=True)):
+            counts[str(sec) or "unknown"] += int(n)
+        return dict(counts)
+
+METADATA_OFFSETS_PATH = os.path.join(EMBEDDINGS_DIR, "metadata_offsets.npy")
 
 print("Loading metadata:", METADATA_PATH)
-with open(METADATA_PATH, "r", encoding="utf-8") as f:
-    metadata = json.load(f)
+if METADATA_PATH.endswith(".npy"):
+    metadata_offsets = np.load(METADATA_OFFSETS_PATH, mmap_mode="r") if os.path.exists(METADATA_OFFSETS_PATH) else None
+    metadata = RecordMetadata(np.load(METADATA_PATH, mmap_mode="r"), metadata_offsets)
+else:
+    with open(METADATA_PATH, "rb") as f:
+        metadata = orjson.loads(f.read())
+
+def get_occurrences(idx, limit=None) -> List[dict]:
+    # every (paper_id, section, chunk_id) a passage was found in (the first `limit` of them, if given);
+    # deduplicated JSON builds store lists
+    if isinstance(metadata, RecordMetadata):
+        return metadata.occurrences(idx, limit)
+    entry = metadata[idx]
+    entries = entry if isinstance(entry, list) else [entry]
+    return entries if limit is None else entries[:limit]
+
+def count_occurrences(idx) -> int:
+    if isinstance(metadata, RecordMetadata):
+        return metadata.num_occurrences(idx)
+    entry = metadata[idx]
+    return len(entry) if isinstance(entry, list) else 1
 
-sample_passages = {}
-if SAMPLE_PASSAGES_PATH:
-    with open(SAMPLE_PASSAGES_PATH, "r", encoding="utf-8") as f:
-        sample_passages = json.load(f)
+# metadata is static: section stats for /search_metadata are computed once
+if isinstance(metadata, RecordMetadata):
+    SECTION_COUNTS = metadata.section_counts()
+else:
+    SECTION_COUNTS = dict(Counter((m.get("section") or "unknown")
+                                  for idx in range(len(metadata)) for m in get_occurrences(idx)))
+
+class PassageStore:
+    """
+    Every passage as one memory-mapped UTF-8 blob (passages.bin) plus int64 byte offsets (offsets.bin);
+    passage i is the byte range offsets[i]:offsets[i+1].
+    """
+    def __init__(self, passages_path, offsets_path):
+        self.offsets = np.fromfile(offsets_path, dtype=np.int64)
+        self.buf = np.memmap(passages_path, dtype=np.uint8, mode="r")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return bytes(self.buf[self.offsets[idx]:self.offsets[idx + 1]]).decode("utf-8")
+
+PASSAGES_BIN_PATH = os.path.join(EMBEDDINGS_DIR, "passages.bin")
+OFFSETS_BIN_PATH = os.path.join(EMBEDDINGS_DIR, "offsets.bin")
+
+passages = []
+if os.path.exists(PASSAGES_BIN_PATH) and os.path.exists(OFFSETS_BIN_PATH):
+    print("Loading passages:", PASSAGES_BIN_PATH)
+    passages = PassageStore(PASSAGES_BIN_PATH, OFFSETS_BIN_PATH)
+elif SAMPLE_PASSAGES_PATH:
+    # older builds only ship the first 200 passages
+    print("Loading passages:", SAMPLE_PASSAGES_PATH)
+    with open(SAMPLE_PASSAGES_PATH, "rb") as f:
+        passages = orjson.loads(f.read()).get("passages", [])
+
+# ----- LOAD PAPER TEXTS (data/texts/*.json) -----
+def load_texts_cache():
+    # parse every per-paper JSON once so request handlers never touch the disk
+    cache = {}
+    for p in glob.glob(os.path.join(TEXTS_DIR, "*.json")):
+        try:
+            with open(p, "rb") as f:
+                cache[os.path.basename(p)[:-len(".json")]] = orjson.loads(f.read())
+        except Exception as e:
+            print("Error reading", p, e)
+    # alias table: 'PMCxxxxxx' and 'pmc_articles_PMCxxxxxx' (exact or lowercase) all map to the same record;
+    # exact file names are inserted first so they win over aliases
+    for base, j in list(cache.items()):
+        short = base.removeprefix("pmc_articles_")
+        for alias in (base.lower(), short, short.lower()):
+            cache.setdefault(alias, j)
+    return cache
+
+print("Loading paper texts:", TEXTS_DIR)
+TEXTS_CACHE = load_texts_cache()
 
 # ----- small helpers -----
+class QueryEmbeddingCache:
+    """
+    Thread-safe LRU of normalized query -> float32 embedding bytes
+    (MiniLM is deterministic and uncased, so embeddings can be memoized per normalized query).
+    """
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, count_miss=True):
+        with self.lock:
+            value = self.data.get(key)
+            if value is None:
+                if count_miss:
+                    self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def info(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "maxsize": self.maxsize, "currsize": len(self.data)}
+
+query_cache = QueryEmbeddingCache(maxsize=4096)
+
+def query_key(q: str) -> str:
+    return q.strip().lower()
+
+def encode_queries(queries: List[str]) -> np.ndarray:
+    # cache hits skip the model; all misses share one forward pass
+    # (both encoders length-sort each batch internally, so padding stays small)
+    keys = [query_key(q) for q in queries]
+    embs = {key: query_cache.get(key) for key in dict.fromkeys(keys)}
+    missing = [key for key, emb in embs.items() if emb is None]
+    if missing:
+        new_embs = model.encode(missing).astype("float32")
+        if NORMALIZE_QUERIES:
+            faiss.normalize_L2(new_embs)
+        for key, emb in zip(missing, new_embs):
+            embs[key] = emb.tobytes()
+            query_cache.put(key, embs[key])
+    return np.vstack([np.frombuffer(embs[key], dtype="float32") for key in keys])
+
+class SearchBatcher:
+    """
+    Micro-batches concurrent queries: queries that pile up while the encoder is busy
+    are encoded and searched together in one model.encode + index.search call.
+    Cached queries skip the queue and go straight to index.search.
+    """
+    def __init__(self, window=BATCH_WINDOW_S, max_batch=MAX_BATCH_SIZE):
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = None
+        self.worker = None
+        self.loop = None
+
+    async def search(self, q: str, k: int):
+        # returns (distances, ids) for a single query, like one row of index.search
+        k = max(1, min(k, index.ntotal))
+        emb = query_cache.get(query_key(q), count_miss=False)
+        if emb is not None:
+            D, I = await asyncio.to_thread(index.search, np.frombuffer(emb, dtype="float32")[None, :], k)
+            return D[0], I[0]
+        loop = asyncio.get_running_loop()
+        if self.worker is None or self.worker.done() or self.loop is not loop:
+            # (re)created on the running loop: a queue/task from a previous loop would never be served
+            self.loop = loop
+            self.queue = asyncio.Queue()
+            self.worker = loop.create_task(self._run())
+        fut = loop.create_future()
+        await self.queue.put((q, k, fut))
+        return await fut
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            if not self.queue.empty():
+                # others are already waiting: give stragglers a moment to join the batch
+                await asyncio.sleep(self.window)
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            queries = [q for q, _, _ in batch]
+            k_max = max(k for _, k, _ in batch)
+            try:
+                D, I = await asyncio.to_thread(self._search_batch, queries, k_max)
+            except Exception as e:
+                for _, _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for row, (_, k, fut) in enumerate(batch):
+                if not fut.done():
+                    fut.set_result((D[row][:k], I[row][:k]))
+
+    @staticmethod
+    def _search_batch(queries, k):
+        return index.search(encode_queries(queries), k)
+
+batcher = SearchBatcher()
+
 def get_snippet_for_index(idx: int) -> Optional[str]:
+    if idx < 0:
+        return None
     try:
-        return sample_passages.get("passages", [])[idx]
+        return passages[idx]
     except Exception:
         return None
 
 def get_text_record_link(paper_id: str) -> Optional[str]:
-    # attempt to load the JSON saved in data/texts/<paper_id>.json and return its "link" if present
-    candidate = os.path.join(TEXTS_DIR, f"{paper_id}.json")
-    if os.path.exists(candidate):
-        try:
-            j = json.load(open(candidate, encoding="utf-8"))
-            return j.get("link") or j.get("url") or None
-        except Exception:
-            return None
-    return None
+    # "link" of the record saved in data/texts/<paper_id>.json, if present
+    j = TEXTS_CACHE.get(paper_id) or {}
+    return j.get("link") or j.get("url") or None
 
 # naive polarity detection (rule-based)
+# one case-insensitive alternation per category ("increase" also covers "increased", etc.)
+_RE_NOEFF = re.compile(r'no significant|no effect|not significantly|no change|no difference', re.I)
+_RE_INC = re.compile(r'increase|enhanced|higher|improved|promote|stimulat', re.I)
+_RE_DEC = re.compile(r'decrease|reduced|reduction|inhibit|lower|suppres', re.I)
+# in priority order: no_effect > increase > decrease
+_POLARITY_PATTERNS = [("no_effect", _RE_NOEFF), ("increase", _RE_INC), ("decrease", _RE_DEC)]
+
+def _compile_polarity_db():
+    # all categories in one Hyperscan database: a single DFA pass over the snippet bytes
+    db = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+    db.compile(
+        expressions=[pat.pattern.encode("ascii") for _, pat in _POLARITY_PATTERNS],
+        ids=list(range(len(_POLARITY_PATTERNS))),
+        elements=len(_POLARITY_PATTERNS),
+        flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH] * len(_POLARITY_PATTERNS),
+    )
+    return db
+
+_POLARITY_DB = _compile_polarity_db() if hyperscan is not None else None
+# the database's scratch space can't serve concurrent scans; /qa runs uncached scans in worker threads
+# (asyncio.to_thread), so this lock is never taken on the event loop
+_POLARITY_DB_LOCK = threading.Lock()
+
+def _detect_polarity_hyperscan(text: str) -> str:
+    found = set()
+    def on_match(pattern_id, start, end, flags, context):
+        found.add(pattern_id)
+    with _POLARITY_DB_LOCK:
+        _POLARITY_DB.scan(text.encode("utf-8"), match_event_handler=on_match)
+    for pattern_id, (label, _) in enumerate(_POLARITY_PATTERNS):
+        if pattern_id in found:
+            return label
+    return "unclear"
+
 def detect_polarity_from_text(text: str) -> str:
     if not text:
         return "unclear"
-    t = text.lower()
-    # strong indicators of increase
-    inc_keywords = ["increase", "increased", "enhanced", "higher", "improved", "promote", "stimulat"]
-    dec_keywords = ["decrease", "decreased", "reduced", "reduction", "inhibit", "lower", "suppres"]
-    no_effect_phrases = ["no significant", "no effect", "not significantly", "no change", "no difference"]
-    for ph in no_effect_phrases:
-        if ph in t:
-            return "no_effect"
-    for kw in inc_keywords:
-        if kw in t:
-            return "increase"
-    for kw in dec_keywords:
-        if kw in t:
-            return "decrease"
+    if _POLARITY_DB is not None:
+        return _detect_polarity_hyperscan(text)
+    # categories are checked in priority order: no_effect > increase > decrease
+    if _RE_NOEFF.search(text):
+        return "no_effect"
+    if _RE_INC.search(text):
+        return "increase"
+    if _RE_DEC.search(text):
+        return "decrease"
     return "unclear"
 
+# passages are static, so their polarity is computed once at startup and /qa just looks it up
+POLARITY_CACHE = [detect_polarity_from_text(p) for p in passages]
+
 def aggregate_polarities(pol_list: List[str]):
     counts = {}
     for p in pol_list:
@@ -167,43 +540,65 @@ def health():
     return {"status": "ok", "num_passages": len(metadata)}
 
 @app.get("/search")
-def search(q: str = Query(..., description="Query string"), k: int = Query(DEFAULT_K)):
-    q_emb = model.encode([q]).astype("float32")
-    D, I = index.search(q_emb, k)
+async def search(q: str = Query(..., description="Query string"), k: int = Query(DEFAULT_K)):
+    D, I = await batcher.search(q, k)
     results = []
-    for dist, idx in zip(D[0], I[0]):
-        meta = metadata[idx] if idx < len(metadata) else {}
+    for dist, idx in zip(D, I):
+        if 0 <= idx < len(metadata):
+            # boilerplate passages can occur in hundreds of papers: only list the first few
+            occurrences = get_occurrences(idx, MAX_OCCURRENCES_PER_RESULT)
+            num_occurrences = count_occurrences(idx)
+        else:
+            occurrences, num_occurrences = [{}], 0
         snippet = get_snippet_for_index(idx)
         # if snippet missing, we can try to load the section from data/texts (fallback; slower)
         results.append({
             "score": float(dist),
-            "meta": meta,
+            "meta": occurrences[0],
+            "occurrences": occurrences,
+            "num_occurrences": num_occurrences,
             "snippet": snippet
         })
     return {"query": q, "k": k, "results": results}
 
 @app.get("/qa", response_model=QAResponse)
-def qa(q: str = Query(..., description="Question / Query"), k: int = Query(10, description="Number of passages to retrieve")):
+async def qa(q: str = Query(..., description="Question / Query"), k: int = Query(10, description="Number of passages to retrieve")):
     # 1) retrieve top-k passages
-    q_emb = model.encode([q]).astype("float32")
-    D, I = index.search(q_emb, k)
+    D, I = await batcher.search(q, k)
     evidence = []
     polarities = []
     titles_seen = set()
-    for dist, idx in zip(D[0], I[0]):
-        if idx >= len(metadata):
+    for dist, idx in zip(D, I):
+        if idx < 0 or idx >= len(metadata):
             continue
-        meta = metadata[idx]
-        pid = meta.get("paper_id") or f"idx_{idx}"
-        title = meta.get("title") or None
-        section = meta.get("section") or None
-        snippet = get_snippet_for_index(idx) or meta.get("excerpt") or ""
-        link = get_text_record_link(pid)
-        if title and title not in titles_seen:
-            titles_seen.add(title)
-        p = detect_polarity_from_text(snippet)
+        occurrences = get_occurrences(idx)
+        snippet = get_snippet_for_index(idx) or occurrences[0].get("excerpt") or ""
+        # one polarity vote per passage, and one evidence card per paper the passage appears in
+        # (capped, so a boilerplate passage can't crowd the other passages out of the 6 cards)
+        if idx < len(POLARITY_CACHE):
+            p = POLARITY_CACHE[idx]
+        elif not snippet:
+            p = "unclear"
+        elif _POLARITY_DB is not None:
+            # uncached snippet: scan off the event loop (the hyperscan path blocks on a lock)
+            p = await asyncio.to_thread(detect_polarity_from_text, snippet)
+        else:
+            p = detect_polarity_from_text(snippet)  # regex path: lock-free and cheap inline
         polarities.append(p)
-        evidence.append({"paper_id": pid, "title": title, "section": section, "snippet": snippet, "link": link})
+        pids_seen = set()
+        for meta in occurrences:
+            if len(pids_seen) >= MAX_CARDS_PER_PASSAGE:
+                break
+            pid = meta.get("paper_id") or f"idx_{idx}"
+            if pid in pids_seen:
+                continue
+            pids_seen.add(pid)
+            title = meta.get("title") or None
+            section = meta.get("section") or None
+            link = get_text_record_link(pid)
+            if title and title not in titles_seen:
+                titles_seen.add(title)
+            evidence.append({"paper_id": pid, "title": title, "section": section, "snippet": snippet, "link": link})
 
     # 2) aggregate polarities into verdict
     agg = aggregate_polarities(polarities)
@@ -237,19 +632,11 @@ def get_paper(paper_id: str):
     Return the JSON file saved by extract_text.py for the requested paper_id.
     Accepts either 'PMCxxxxxx' or 'pmc_articles_PMCxxxxxx' as paper_id.
     """
-    # Always check both possible filename patterns
-    candidates = [
-        os.path.join("data", "texts", f"{paper_id}.json"),
-        os.path.join("data", "texts", f"pmc_articles_{paper_id}.json"),
-        os.path.join("data", "texts", f"{paper_id.lower()}.json"),
-        os.path.join("data", "texts", f"pmc_articles_{paper_id.lower()}.json")
-    ]
-    path = next((p for p in candidates if os.path.exists(p)), None)
-    if not path:
+    record = TEXTS_CACHE.get(paper_id)
+    if record is None:
         raise HTTPException(status_code=404, detail="paper not found")
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            j = json.load(f)
+        j = dict(record)  # shallow copy: don't mutate the shared cache entry
         # Ensure illustrations is a list
         if "illustrations" in j:
             if isinstance(j["illustrations"], tuple):
@@ -272,7 +659,7 @@ def get_paper(paper_id: str):
 def feedback(payload: dict = Body(...)):
     """
     Accepts JSON like: {"paper_id":"pmc_articles_PMC3603133","type":"useful|not_useful|wrong","note":"optional note"}
-    Stores into data/feedback.json
+    Appends one line to data/feedback.jsonl
     """
     ok = _append_feedback(payload)
     if not ok:
@@ -285,11 +672,14 @@ def search_metadata():
     """
     Return small stats: counts per section in metadata (fast summary)
     """
-    counts = {}
-    for m in metadata:
-        sec = m.get("section") or "unknown"
-        counts[sec] = counts.get(sec, 0) + 1
-    return {"num_passages": len(metadata), "by_section": counts}
+    return {"num_passages": len(metadata), "by_section": SECTION_COUNTS}
+
+@app.get("/cache_stats")
+def cache_stats():
+    """
+    Debug: hit/miss stats of the query embedding cache
+    """
+    return query_cache.info()
 
 def summarize_text_local(text: str, max_length: int = 120, min_length: int = 40) -> str:
     max_chunk = 1024
@@ -298,7 +688,7 @@ def summarize_text_local(text: str, max_length: int = 120, min_length: int = 40)
     if len(text) > max_chunk:
         text = text[:max_chunk]
     try:
-        summary = summarizer(text, max_length=max_length, min_length=min_length, do_sample=False)
+        summary = summarizer(text, max_length=max_length, min_length=min_length, do_sample=False, num_beams=1)
         return summary[0]['summary_text']
     except Exception as e:
         print(f"Summarization error: {e}")
@@ -311,72 +701,104 @@ def summarize_text_flexible(text: str, max_length: int = 1000, min_length: int =
     if len(text) > max_chunk:
         text = text[:max_chunk]
     try:
-        summary = summarizer(text, max_length=max_length, min_length=min_length, do_sample=False)
+        summary = summarizer(text, max_length=max_length, min_length=min_length, do_sample=False, num_beams=1)
         return summary[0]['summary_text']
     except Exception as e:
         print(f"Summarization error: {e}")
         return "Error: Could not generate summary."
 
 def clean_text_for_summary(text: str) -> str:
-    import re
     # Remove parenthetical citations with 'et al.' and year
-    text = re.sub(r'\(.*?et al\.,? ?\d{4}.*?\)', '', text)
+    text = _RE_ETAL.sub('', text)
     # Remove all URLs
-    text = re.sub(r'https?://\S+', '', text)
+    text = _RE_URL.sub('', text)
     # Remove any remaining parenthetical citations (e.g., (Author, Year))
-    text = re.sub(r'\([^)]+\d{4}[^)]*\)', '', text)
+    text = _RE_CITE.sub('', text)
     # Remove extra whitespace
-    text = re.sub(r'\s+', ' ', text)
+    text = _RE_WS.sub(' ', text)
     return text.strip()
 
+# canonical paper_id -> summary payload (at most one entry per paper, since paper texts are static)
+SUMMARY_CACHE = {}
+
+def _summarize_paper(paper_id: str, j: dict) -> dict:
+    # summaries are memoized in-process and persisted to data/summaries/, keyed on the canonical paper_id
+    payload = SUMMARY_CACHE.get(paper_id)
+    if payload is not None:
+        return payload
+    summary_path = os.path.join(SUMMARIES_DIR, f"{paper_id}.json")
+    if os.path.exists(summary_path):
+        try:
+            with open(summary_path, "rb") as f:
+                payload = orjson.loads(f.read())
+            SUMMARY_CACHE[paper_id] = payload
+            return payload
+        except (OSError, orjson.JSONDecodeError) as e:
+            # unreadable / corrupt file: treat as a cache miss and regenerate (the rewrite replaces it)
+            print(f"Ignoring bad summary file {summary_path}: {e}")
+    print(f"[DEBUG] Top-level keys: {list(j.keys())}")
+    # Try to get figures from top-level, then from sections
+    illustrations = []
+    figures_top = j.get("figures")
+    figures_sections = None
+    sections = j.get("sections", {})
+    if not figures_top and isinstance(sections, dict):
+        figures_sections = sections.get("figures")
+    print(f"[DEBUG] Figures found (top-level): {figures_top}")
+    print(f"[DEBUG] Figures found (sections): {figures_sections}")
+    if isinstance(figures_top, list):
+        illustrations = list(figures_top)
+    elif isinstance(figures_sections, list):
+        illustrations = list(figures_sections)
+    # Only join string values for summary
+    full_text = "\n\n".join(str(v) for v in sections.values() if isinstance(v, str))
+    # Clean text before summarization
+    cleaned_text = clean_text_for_summary(full_text)
+    summary = summarize_text_flexible(cleaned_text)
+    # Also extract image URLs from section text
+    for sec in sections.values():
+        if isinstance(sec, str) and "http" in sec:
+            urls = _RE_IMG_URL.findall(sec)
+            illustrations.extend(urls)
+    illustrations = [url for url in set(illustrations) if url]
+    print(f"[DEBUG] Final illustrations returned: {illustrations}")
+    payload = {
+        "paper_id": paper_id,
+        "title": j.get("title"),
+        "summary": summary,
+        "link": j.get("link"),
+        "illustrations": illustrations[:6]
+    }
+    if summary.startswith("Error:"):
+        # failed generation: return it, but don't memoize or persist it
+        return payload
+    SUMMARY_CACHE[paper_id] = payload
+    # write to a temp file and rename it into place, so a crash or full disk never leaves a truncated
+    # summary file behind and other workers only ever see complete files
+    tmp_path = f"{summary_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(SUMMARIES_DIR, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
+        os.replace(tmp_path, summary_path)
+    except OSError as e:
+        print(f"Could not persist summary for {paper_id}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    return payload
+
 @app.get("/paper_summarized/{paper_id}")
 def get_paper_summarized(paper_id: str):
-    # Normalize paper_id for candidate filenames
-    pid_variants = [paper_id, paper_id.lower()]
-    if not paper_id.startswith("pmc_articles_"):
-        pid_variants += [f"pmc_articles_{paper_id}", f"pmc_articles_{paper_id.lower()}"]
-    candidates = [os.path.join("data", "texts", f"{pid}.json") for pid in pid_variants]
-    path = next((p for p in candidates if os.path.exists(p)), None)
-    print(f"[DEBUG] Reading file: {path}")
-    if not path:
+    j = TEXTS_CACHE.get(paper_id)
+    print(f"[DEBUG] Cached record found: {j is not None}")
+    if j is None:
         raise HTTPException(status_code=404, detail="paper not found")
+    # every alias of a paper shares one cache entry / summary file
+    canonical_id = j.get("paper_id") or paper_id
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            j = json.load(f)
-        print(f"[DEBUG] Top-level keys: {list(j.keys())}")
-        # Try to get figures from top-level, then from sections
-        illustrations = []
-        figures_top = j.get("figures")
-        figures_sections = None
-        sections = j.get("sections", {})
-        if not figures_top and isinstance(sections, dict):
-            figures_sections = sections.get("figures")
-        print(f"[DEBUG] Figures found (top-level): {figures_top}")
-        print(f"[DEBUG] Figures found (sections): {figures_sections}")
-        if isinstance(figures_top, list):
-            illustrations = figures_top
-        elif isinstance(figures_sections, list):
-            illustrations = figures_sections
-        # Only join string values for summary
-        full_text = "\n\n".join(str(v) for v in sections.values() if isinstance(v, str))
-        # Clean text before summarization
-        cleaned_text = clean_text_for_summary(full_text)
-        summary = summarize_text_flexible(cleaned_text)
-        # Also extract image URLs from section text
-        for sec in sections.values():
-            if isinstance(sec, str) and "http" in sec:
-                import re
-                urls = re.findall(r'(https?://[^\s]+\.(?:png|jpg|jpeg|gif))', sec)
-                illustrations.extend(urls)
-        illustrations = [url for url in set(illustrations) if url]
-        print(f"[DEBUG] Final illustrations returned: {illustrations}")
-        return {
-            "paper_id": paper_id,
-            "title": j.get("title"),
-            "summary": summary,
-            "link": j.get("link"),
-            "illustrations": illustrations[:6]
-        }
+        return {**_summarize_paper(canonical_id, j), "paper_id": paper_id}
     except Exception as e:
         print(f"Summary endpoint error for {paper_id}: {e}")
         return {
@@ -385,4 +807,4 @@ def get_paper_summarized(paper_id: str):
             "summary": f"Error: Could not generate summary. ({e})",
             "link": None,
             "illustrations": []
-        }
\ No newline at end of file
+        }
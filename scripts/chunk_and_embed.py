@@ -5,8 +5,12 @@ Read JSON files from data/texts/, chunk text, compute embeddings using sentence-
 and save a FAISS index + metadata to data/embeddings/
 """
 import os
+import re
 import glob
-import json
+import orjson
+import xxhash
+import nltk
+import torch
 from sentence_transformers import SentenceTransformer
 import numpy as np
 import faiss
@@ -18,34 +22,150 @@ OUT_DIR = os.path.join("data", "embeddings")
 os.makedirs(OUT_DIR, exist_ok=True)
 
 MODEL_NAME = "all-MiniLM-L6-v2"
-CHUNK_CHARS = 800  # approx 200-300 tokens (character-based chunking for speed)
+CHUNK_CHARS = 800  # approx 200-300 tokens per window
+CHUNK_OVERLAP = 100  # chars carried over from the end of the previous window
+PQ_M = 64  # PQ sub-quantizers (must divide the embedding dim)
+PQ_NBITS = 8
+ENCODE_BATCH_SIZE = 256
+MIN_TRAIN_POINTS = 256 * 39  # faiss wants ~39 training points per PQ centroid
 
 def load_json_files(in_dir):
     files = sorted(glob.glob(os.path.join(in_dir, "*.json")))
     docs = []
     for p in files:
         try:
-            j = json.load(open(p, encoding="utf-8"))
+            with open(p, "rb") as f:
+                j = orjson.loads(f.read())
         except Exception as e:
             print("Error reading", p, e)
             continue
         docs.append(j)
     return docs
 
-def chunk_text(text, size=CHUNK_CHARS):
+_RE_SENT_END = re.compile(r"(?<=[.!?])\s+")
+
+def split_sentences(text):
+    try:
+        return nltk.sent_tokenize(text)
+    except LookupError:
+        # punkt data not downloaded: naive split on sentence-ending punctuation
+        return _RE_SENT_END.split(text)
+
+def overlap_tail(chunk, overlap=CHUNK_OVERLAP):
+    # last ~overlap chars of a window, starting at a word boundary
+    if overlap <= 0 or len(chunk) <= overlap:
+        return ""
+    tail = chunk[-overlap:]
+    cut = tail.find(" ")
+    return tail[cut + 1:] if cut != -1 else ""
+
+def chunk_text(text, size=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    """
+    Greedily pack whole sentences into ~size-char windows; each window starts with the
+    last ~overlap chars of the previous one. Over-long sentences are hard-split.
+    """
     text = text.strip()
     if not text:
         return []
     chunks = []
-    for i in range(0, len(text), size):
-        chunk = text[i:i+size].strip()
-        if len(chunk) >= 30:
-            chunks.append(chunk)
-    return chunks
+    current, length, fresh = [], 0, 0
+    for sent in split_sentences(text):
+        for piece in (sent[i:i+size] for i in range(0, len(sent), size)):
+            if fresh and length + 1 + len(piece) > size:
+                chunks.append(" ".join(current))
+                tail = overlap_tail(chunks[-1], overlap)
+                current, length, fresh = ([tail], len(tail), 0) if tail else ([], 0, 0)
+            if not fresh and current and length + 1 + len(piece) > size:
+                # overlap seed + this piece would overflow the window: shrink the seed to fit
+                tail = overlap_tail(current[0], size - 1 - len(piece))
+                current, length = ([tail], len(tail)) if tail else ([], 0)
+            current.append(piece)
+            length += len(piece) + (1 if length else 0)
+            fresh += 1
+    if fresh:
+        chunks.append(" ".join(current))
+    return [c for c in chunks if len(c) >= 30]
+
+def dedupe_passages(passages, metadata):
+    """
+    Collapse identical chunks (boilerplate shared across papers) into one passage.
+    Returns the unique passages and, per passage, the list of metadata of all its occurrences.
+    """
+    seen = {}  # digest -> indices of the unique passages with that digest
+    uniq_passages = []
+    uniq_meta = []
+    for ch, md in zip(passages, metadata):
+        bucket = seen.setdefault(xxhash.xxh3_64_intdigest(ch), [])
+        # the digest only narrows the candidates; a 64-bit collision must not merge different chunks
+        match = next((i for i in bucket if uniq_passages[i] == ch), None)
+        if match is not None:
+            uniq_meta[match].append(md)
+        else:
+            bucket.append(len(uniq_passages))
+            uniq_passages.append(ch)
+            uniq_meta.append([md])
+    return uniq_passages, uniq_meta
+
+def metadata_to_records(metadata):
+    """
+    Fixed-width SoA copy of the per-passage occurrence lists (string widths are inferred from the data):
+    all occurrences flattened into one record array, plus int64 offsets so that passage i's
+    occurrences are records[offsets[i]:offsets[i+1]].
+    """
+    flat = [m for occurrences in metadata for m in occurrences]
+    records = np.rec.fromarrays([
+        np.array([m["paper_id"] for m in flat]),
+        np.array([m["section"] for m in flat]),
+        np.array([m["chunk_id"] for m in flat], dtype=np.int32),
+    ], names="paper_id,section,chunk_id")
+    offsets = np.cumsum([0] + [len(occurrences) for occurrences in metadata], dtype=np.int64)
+    return records, offsets
+
+def pick_device():
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+def load_model():
+    device = pick_device()
+    model = SentenceTransformer(MODEL_NAME, device=device)
+    if device != "cpu":
+        model.half()  # fp16 on GPU/MPS; embeddings are cast back to float32 before indexing
+    print("Encoding on", device)
+    return model
+
+def build_index(embeddings):
+    """
+    Inner-product (cosine, embeddings are normalized) IVF-PQ index with ~sqrt(N) lists;
+    falls back to exact IndexFlatIP for corpora too small to train PQ.
+    """
+    n, dim = embeddings.shape
+    if n < MIN_TRAIN_POINTS or dim % PQ_M != 0:
+        print(f"Using IndexFlatIP ({n} passages, dim={dim})")
+        return faiss.IndexFlatIP(dim)
+    nlist = int(math.sqrt(n))
+    print(f"Training IndexIVFPQ: nlist={nlist}, m={PQ_M}, nbits={PQ_NBITS}")
+    quantizer = faiss.IndexFlatIP(dim)
+    index = faiss.IndexIVFPQ(quantizer, dim, nlist, PQ_M, PQ_NBITS, faiss.METRIC_INNER_PRODUCT)
+    index.train(embeddings)
+    return index
+
+def write_passages(passages, out_dir):
+    # one UTF-8 blob + int64 byte offsets; the backend memory-maps both for O(1) snippet lookup
+    offsets = [0]
+    buf = bytearray()
+    for p in passages:
+        buf += p.encode("utf-8")
+        offsets.append(len(buf))
+    np.array(offsets, dtype=np.int64).tofile(os.path.join(out_dir, "offsets.bin"))
+    with open(os.path.join(out_dir, "passages.bin"), "wb") as f:
+        f.write(buf)
 
 def main():
     docs = load_json_files(IN_DIR)
-    model = SentenceTransformer(MODEL_NAME)
+    model = load_model()
     passages = []
     metadata = []
     for doc in docs:
@@ -53,7 +173,7 @@ def main():
         title = doc.get("title","")
         sections = doc.get("sections", {})
         for section_name, text in sections.items():
-            if not text:
+            if not text or not isinstance(text, str):  # e.g. the "figures" list
                 continue
             chs = chunk_text(text, CHUNK_CHARS)
             for i, ch in enumerate(chs):
@@ -69,17 +189,30 @@ def main():
         print("No passages found in", IN_DIR)
         return
 
+    num_chunks = len(passages)
+    passages, metadata = dedupe_passages(passages, metadata)
+    print(f"Deduplicated {num_chunks} chunks to {len(passages)} unique passages")
+
     print(f"Computing embeddings for {len(passages)} passages using {MODEL_NAME} ...")
-    embeddings = model.encode(passages, show_progress_bar=True, convert_to_numpy=True)
+    embeddings = model.encode(passages, batch_size=ENCODE_BATCH_SIZE, show_progress_bar=True,
+                              convert_to_numpy=True, normalize_embeddings=True)
     embeddings = embeddings.astype("float32")
+    faiss.normalize_L2(embeddings)  # re-normalize in fp32 (fp16 encoding drifts off unit norm)
     dim = embeddings.shape[1]
 
-    index = faiss.IndexFlatL2(dim)
+    index = build_index(embeddings)
     index.add(embeddings)
     faiss.write_index(index, os.path.join(OUT_DIR, "spacebio.index"))
-    json.dump(metadata, open(os.path.join(OUT_DIR, "metadata.json"), "w", encoding="utf-8"), ensure_ascii=False, indent=2)
+    records, offsets = metadata_to_records(metadata)
+    np.save(os.path.join(OUT_DIR, "metadata.npy"), records)
+    np.save(os.path.join(OUT_DIR, "metadata_offsets.npy"), offsets)
+    # human-readable copy (one list of occurrences per passage, with titles); the backend prefers metadata.npy
+    with open(os.path.join(OUT_DIR, "metadata.json"), "wb") as f:
+        f.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
+    write_passages(passages, OUT_DIR)
     # Save a small sample of passages for debugging / frontend use
-    json.dump({"passages": passages[:200]}, open(os.path.join(OUT_DIR, "sample_passages.json"), "w", encoding="utf-8"), ensure_ascii=False, indent=2)
+    with open(os.path.join(OUT_DIR, "sample_passages.json"), "wb") as f:
+        f.write(orjson.dumps({"passages": passages[:200]}, option=orjson.OPT_INDENT_2))
     print("Saved index and metadata to", OUT_DIR)
 
 if __name__ == "__main__":
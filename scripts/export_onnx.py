@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# scripts/export_onnx.py
+"""
+Export the summarization and query-embedding models to ONNX, apply dynamic int8 quantization,
+and save them to data/models/ where backend/main.py picks them up at startup.
+"""
+import os
+import glob
+import shutil
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTModelForSeq2SeqLM, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from onnxruntime.quantization import QuantType, quantize_dynamic
+from transformers import AutoTokenizer
+
+MODELS_DIR = os.path.join("data", "models")
+SUMMARIZER_MODEL = "sshleifer/distilbart-cnn-12-6"
+SUMMARIZER_ONNX_DIR = os.path.join(MODELS_DIR, "distilbart-cnn-12-6-onnx-int8")
+ENCODER_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+ENCODER_ONNX_DIR = os.path.join(MODELS_DIR, "all-MiniLM-L6-v2-onnx-int8")
+
+def quantize_dir(src_dir, out_dir):
+    # int8 weights for every exported graph; configs / tokenizer files are copied as-is
+    os.makedirs(out_dir, exist_ok=True)
+    for p in glob.glob(os.path.join(src_dir, "*")):
+        name = os.path.basename(p)
+        if name.endswith(".onnx"):
+            print("Quantizing", name)
+            quantize_dynamic(p, os.path.join(out_dir, name), weight_type=QuantType.QInt8)
+        elif os.path.isfile(p):
+            shutil.copy(p, os.path.join(out_dir, name))
+
+def export_summarizer():
+    fp32_dir = SUMMARIZER_ONNX_DIR + "-fp32"
+    print("Exporting", SUMMARIZER_MODEL, "to ONNX ...")
+    model = ORTModelForSeq2SeqLM.from_pretrained(SUMMARIZER_MODEL, export=True)
+    model.save_pretrained(fp32_dir)
+    AutoTokenizer.from_pretrained(SUMMARIZER_MODEL).save_pretrained(fp32_dir)
+    quantize_dir(fp32_dir, SUMMARIZER_ONNX_DIR)
+    shutil.rmtree(fp32_dir)
+    print("Saved quantized summarizer to", SUMMARIZER_ONNX_DIR)
+
+def export_encoder():
+    # saved as model_quantized.onnx (int8 weights, VNNI-friendly dynamic activation quantization)
+    print("Exporting", ENCODER_MODEL, "to ONNX ...")
+    model = ORTModelForFeatureExtraction.from_pretrained(ENCODER_MODEL, export=True)
+    qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    ORTQuantizer.from_pretrained(model).quantize(save_dir=ENCODER_ONNX_DIR, quantization_config=qconfig)
+    model.config.save_pretrained(ENCODER_ONNX_DIR)
+    AutoTokenizer.from_pretrained(ENCODER_MODEL).save_pretrained(ENCODER_ONNX_DIR)
+    print("Saved quantized encoder to", ENCODER_ONNX_DIR)
+
+def main():
+    export_summarizer()
+    export_encoder()
+
+if __name__ == "__main__":
+    main()
@@ -10,12 +10,14 @@ Assumptions:
 """
 import os
 import time
-import json
+import orjson
 import re
+import asyncio
+import aiohttp
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 from urllib.parse import urlparse
+from email.utils import parsedate_to_datetime
 from tqdm import tqdm
 
 CSV_PATH = os.path.join("data", "SB_publication_PMC.csv")
@@ -25,120 +27,226 @@ os.makedirs(OUT_DIR, exist_ok=True)
 HEADERS = {
     "User-Agent": "space-bio-hackathon-bot/1.0 (+https://example.org/)"
 }
+CONCURRENCY = 8  # max in-flight fetches
+REQUESTS_PER_SECOND = 5  # polite cap on request starts per host
+MAX_RETRIES = 3  # for connection errors, timeouts, 429 and 5xx
+RETRY_BACKOFF = 0.5  # seconds, doubled after every attempt
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# precompiled patterns used by the extraction loops
+_RE_UNSAFE = re.compile(r"[^\w\-_.]")
+_RE_FIG = re.compile(r"fig|figure", re.I)
+_RE_BAD = re.compile(r"logo|advert|background|icon|spacer", re.I)
+_RE_ABSTRACT = re.compile(r"abstract", re.I)
+_RE_HEADING_PREFIX = re.compile(r"h[1-6]")
+_RE_RESULTS = re.compile(r"\bResults\b", re.I)
+_RE_CONCLUSION = re.compile(r"\bConclusion[s]?\b|\bDiscussion\b", re.I)
+_RE_WS = re.compile(r"\s+")
 
 def safe_filename(s):
-    return re.sub(r"[^\w\-_.]", "_", s)[:160]
+    return _RE_UNSAFE.sub("_", s)[:160]
+
+class HostRateLimiter:
+    """
+    Spaces request starts to the same host at least 1/rate seconds apart.
+    """
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._locks = {}
+        self._next = {}
+
+    async def wait(self, url):
+        host = urlparse(url).netloc
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            start = max(now, self._next.get(host, 0.0))
+            if start > now:
+                await asyncio.sleep(start - now)
+            self._next[host] = start + self.interval
 
-def fetch_html(url, timeout=20):
+def _retry_after(r):
+    # Retry-After is either delay-seconds or an HTTP date
+    value = r.headers.get("Retry-After")
+    if not value:
+        return None
     try:
-        r = requests.get(url, headers=HEADERS, timeout=timeout)
-        if r.status_code == 200:
-            return r.text
-        else:
-            print(f"Non-200 {r.status_code} for {url}")
-            return None
-    except Exception as e:
-        print(f"Error fetching {url}: {e}")
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
         return None
 
+async def fetch_html(session, sem, limiter, url):
+    for attempt in range(MAX_RETRIES + 1):
+        last_try = attempt == MAX_RETRIES
+        delay = RETRY_BACKOFF * 2 ** attempt
+        # every attempt takes a concurrency slot and respects the per-host rate;
+        # the backoff below runs with the slot released
+        async with sem:
+            await limiter.wait(url)
+            try:
+                async with session.get(url) as r:
+                    if r.status == 200:
+                        return await r.text()
+                    if r.status not in RETRY_STATUSES or last_try:
+                        print(f"Non-200 {r.status} for {url}")
+                        return None
+                    delay = max(delay, _retry_after(r) or 0.0)
+            except Exception as e:
+                if last_try:
+                    print(f"Error fetching {url}: {e}")
+                    return None
+        await asyncio.sleep(delay)
+
+def _is_element(node):
+    # text / comment / doctype nodes have pseudo tags like "-text", "_comment", "!doctype"
+    return not node.tag.startswith(("-", "_", "!"))
+
+def _next_element(node):
+    # next sibling element, skipping text nodes (like bs4's find_next_sibling())
+    sib = node.next
+    while sib is not None and not _is_element(sib):
+        sib = sib.next
+    return sib
+
+def _find_parent(node, tags):
+    parent = node.parent
+    while parent is not None and parent.tag not in tags:
+        parent = parent.parent
+    return parent
+
+def _find_text_node(tree, pattern):
+    # first text node in document order matching pattern (like bs4's find(text=pattern))
+    if tree.root is None:
+        return None
+    for node in tree.root.traverse(include_text=True):
+        if node.tag == "-text" and pattern.search(node.text(deep=False)):
+            return node
+    return None
+
+def _text(node):
+    return node.text(deep=True, separator=" ", strip=True)
+
+def _collect_following_text(node, stop_at_heading):
+    parts = []
+    sib = _next_element(node)
+    while sib is not None and not (stop_at_heading and _RE_HEADING_PREFIX.match(sib.tag)):
+        parts.append(_text(sib))
+        sib = _next_element(sib)
+    return parts
+
+def _is_figure_image(alt, parent_text, classes):
+    # Filter: must have 'fig' or 'figure' in alt/caption or parent, and not logo/advertisement/background
+    return bool(_RE_FIG.search(alt) or _RE_FIG.search(parent_text)) and not _RE_BAD.search(alt+classes)
+
 def extract_sections_from_pmc_html(html):
     """
     Parse PMC article HTML and extract Abstract, Results, Conclusions/Discussion, and filtered figure/image URLs.
     Returns dict with keys 'Abstract','Results','Conclusion','figures'
     """
-    soup = BeautifulSoup(html, "lxml")
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(["script", "style"])  # never article text
     text_by_section = {"Abstract": "", "Results": "", "Conclusion": ""}
     figures = []
-    figure_containers = soup.find_all(["figure", "div"], class_=re.compile(r"fig|figure", re.I))
+    figure_containers = [n for n in tree.css("figure, div") if _RE_FIG.search(n.attributes.get("class") or "")]
 
     # Abstract: look for tag with id 'abstract' or <abstract> element
-    abstract = soup.find(id=re.compile(r"abstract", re.I)) or soup.find("abstract")
+    abstract = next((n for n in tree.css("[id]") if _RE_ABSTRACT.search(n.attributes.get("id") or "")), None)
+    abstract = abstract or tree.css_first("abstract")
     if abstract:
-        text_by_section["Abstract"] = " ".join(abstract.stripped_strings)
+        text_by_section["Abstract"] = _text(abstract)
 
     # Some PMC pages have sections with headings; find headings that match Results or Conclusion
-    for header in soup.find_all(re.compile("^h[1-6]$")):
-        heading = header.get_text(separator=" ").strip().lower()
+    for header in tree.css("h1, h2, h3, h4, h5, h6"):
+        heading = header.text(deep=True, separator=" ").strip().lower()
         if "result" in heading and not text_by_section["Results"]:
             # collect next sibling paragraphs until next header of same level
-            parts = []
-            sib = header.find_next_sibling()
-            while sib and sib.name and not re.match(r"h[1-6]", sib.name):
-                parts.append(" ".join(sib.stripped_strings))
-                sib = sib.find_next_sibling()
+            parts = _collect_following_text(header, stop_at_heading=True)
             text_by_section["Results"] = " ".join([p for p in parts if p])
         if ("conclusion" in heading or "discussion" in heading) and not text_by_section["Conclusion"]:
-            parts = []
-            sib = header.find_next_sibling()
-            while sib and sib.name and not re.match(r"h[1-6]", sib.name):
-                parts.append(" ".join(sib.stripped_strings))
-                sib = sib.find_next_sibling()
+            parts = _collect_following_text(header, stop_at_heading=True)
             text_by_section["Conclusion"] = " ".join([p for p in parts if p])
 
     # Fallbacks: try to find section by searching for 'Results' or 'Conclusion' headings anywhere
     if not text_by_section["Results"]:
-        results_heading = soup.find(text=re.compile(r"\bResults\b", re.I))
-        if results_heading:
-            parent = results_heading.parent
+        results_heading = _find_text_node(tree, _RE_RESULTS)
+        if results_heading and results_heading.parent:
             # gather following siblings text
-            parts = []
-            sib = parent.find_next_sibling()
-            while sib:
-                parts.append(" ".join(sib.stripped_strings))
-                sib = sib.find_next_sibling()
+            parts = _collect_following_text(results_heading.parent, stop_at_heading=False)
             text_by_section["Results"] = " ".join(parts)
 
     if not text_by_section["Conclusion"]:
-        concl_heading = soup.find(text=re.compile(r"\bConclusion[s]?\b|\bDiscussion\b", re.I))
-        if concl_heading:
-            parent = concl_heading.parent
-            parts = []
-            sib = parent.find_next_sibling()
-            while sib:
-                parts.append(" ".join(sib.stripped_strings))
-                sib = sib.find_next_sibling()
+        concl_heading = _find_text_node(tree, _RE_CONCLUSION)
+        if concl_heading and concl_heading.parent:
+            parts = _collect_following_text(concl_heading.parent, stop_at_heading=False)
             text_by_section["Conclusion"] = " ".join(parts)
 
     # As a last resort, try to get abstract text from meta tags or the first paragraphs
     if not text_by_section["Abstract"]:
-        meta_desc = soup.find("meta", {"name": "description"})
-        if meta_desc and meta_desc.get("content"):
-            text_by_section["Abstract"] = meta_desc.get("content")
+        meta_desc = tree.css_first('meta[name="description"]')
+        if meta_desc and meta_desc.attributes.get("content"):
+            text_by_section["Abstract"] = meta_desc.attributes.get("content")
 
     # Filtered figure/image extraction
     for fig in figure_containers:
-        imgs = fig.find_all("img")
-        for img in imgs:
-            src = img.get("src")
-            alt = img.get("alt", "").lower()
-            classes = " ".join(img.get("class", []))
-            # Filter: must have 'fig' or 'figure' in alt/caption or parent, and not logo/advertisement/background
-            parent_text = fig.get_text(" ", strip=True).lower()
-            if src and src.startswith("http"):
-                if (re.search(r"fig|figure", alt) or re.search(r"fig|figure", parent_text)) and not re.search(r"logo|advert|background|icon|spacer", alt+classes):
-                    figures.append(src)
-            elif src:
-                if (re.search(r"fig|figure", alt) or re.search(r"fig|figure", parent_text)) and not re.search(r"logo|advert|background|icon|spacer", alt+classes):
-                    figures.append(src)
+        parent_text = _text(fig).lower()
+        for img in fig.css("img"):
+            attrs = img.attributes
+            src = attrs.get("src")
+            alt = (attrs.get("alt") or "").lower()
+            classes = " ".join((attrs.get("class") or "").split())
+            if src and _is_figure_image(alt, parent_text, classes):
+                figures.append(src)
     # Also catch any top-level images in the article body, but only if they pass filters
-    for img in soup.find_all("img"):
-        src = img.get("src")
-        alt = img.get("alt", "").lower()
-        classes = " ".join(img.get("class", []))
+    for img in tree.css("img"):
+        attrs = img.attributes
+        src = attrs.get("src")
+        alt = (attrs.get("alt") or "").lower()
+        classes = " ".join((attrs.get("class") or "").split())
         if src and src.startswith("http") and src not in figures:
             # Only add if alt or parent text suggests it's a figure
-            parent = img.find_parent(["figure", "div"])
-            parent_text = parent.get_text(" ", strip=True).lower() if parent else ""
-            if (re.search(r"fig|figure", alt) or re.search(r"fig|figure", parent_text)) and not re.search(r"logo|advert|background|icon|spacer", alt+classes):
+            parent = _find_parent(img, ("figure", "div"))
+            parent_text = _text(parent).lower() if parent else ""
+            if _is_figure_image(alt, parent_text, classes):
                 figures.append(src)
 
     # Clean up whitespace
     for k, v in text_by_section.items():
-        text_by_section[k] = re.sub(r"\s+", " ", v).strip()
+        text_by_section[k] = _RE_WS.sub(" ", v).strip()
 
     return {**text_by_section, "figures": figures}
 
-def main(limit=None, pause=0.6):
+async def process_paper(session, sem, limiter, paper_id, title, link, out_path):
+    html = await fetch_html(session, sem, limiter, link)
+    if not html:
+        return
+    # parsing is CPU-bound: keep it off the event loop so fetches continue meanwhile
+    sections = await asyncio.to_thread(extract_sections_from_pmc_html, html)
+    payload = {
+        "paper_id": paper_id,
+        "title": title,
+        "link": link,
+        "sections": sections
+    }
+    with open(out_path, "wb") as f:
+        f.write(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
+
+async def fetch_all(jobs, concurrency=CONCURRENCY, rate=REQUESTS_PER_SECOND, timeout=20):
+    sem = asyncio.Semaphore(concurrency)
+    limiter = HostRateLimiter(rate)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    # one pooled keep-alive connector for the whole run: TCP/TLS handshakes are paid once per connection
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency,
+                                     keepalive_timeout=30, ttl_dns_cache=300)
+    async with aiohttp.ClientSession(headers=HEADERS, timeout=client_timeout, connector=connector) as session:
+        tasks = [process_paper(session, sem, limiter, *job) for job in jobs]
+        for fut in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
+            await fut
+
+def main(limit=None, concurrency=CONCURRENCY, rate=REQUESTS_PER_SECOND):
     df = pd.read_csv(CSV_PATH)
     if "Link" not in df.columns:
         print("CSV missing 'Link' column. Columns:", df.columns.tolist())
@@ -148,7 +256,8 @@ def main(limit=None, pause=0.6):
     if limit:
         rows = list(rows)[:limit]
 
-    for row in tqdm(rows):
+    jobs = []
+    for row in rows:
         title = getattr(row, 'Title', None) or ""
         link = getattr(row, 'Link', None) or ""
         if not link or not link.startswith("http"):
@@ -160,21 +269,9 @@ def main(limit=None, pause=0.6):
         if os.path.exists(out_path):
             # skip if already fetched
             continue
+        jobs.append((paper_id, title, link, out_path))
 
-        html = fetch_html(link)
-        if not html:
-            continue
-        sections = extract_sections_from_pmc_html(html)
-        payload = {
-            "paper_id": paper_id,
-            "title": title,
-            "link": link,
-            "sections": sections
-        }
-        with open(out_path, "w", encoding="utf-8") as f:
-            json.dump(payload, f, ensure_ascii=False, indent=2)
-        # polite pause to avoid hammering
-        time.sleep(pause)
+    asyncio.run(fetch_all(jobs, concurrency=concurrency, rate=rate))
 
 if __name__ == "__main__":
     # optional CLI: first argument is limit (int)